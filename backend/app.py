@@ -1,17 +1,41 @@
 # backend/app.py
 import os
+import re
+import json
+import math
+import gzip
+import time
+import bisect
 import threading
 import uuid
+import queue
+import atexit
 import logging
+import logging.handlers
+import contextvars
+from array import array
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import date,datetime,timezone, timedelta
 from google.cloud import firestore as firestore_module
 from google.api_core import exceptions as google_exceptions
 FIRESTORE = firestore_module  # Only for SERVER_TIMESTAMP
-from flask import Flask, request, jsonify
+from contextlib import contextmanager
+from flask import Flask, request, jsonify, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import random   
 
+# Optional fast paths: orjson for encoding, brotli for compression.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 SUGGESTION_MAP = {
     "stress": {
         "title": "Try a 5-minute breathing exercise",
@@ -32,6 +56,52 @@ MODEL_NAME = os.environ.get("MODEL_NAME", "gemini-1.5-pro")
 DAILY_GLOBAL_API_LIMIT = int(os.environ.get("DAILY_GLOBAL_API_LIMIT", "240"))
 QUOTA_FAIL_OPEN = os.environ.get("QUOTA_FAIL_OPEN", "false").lower() in ("1", "true", "yes")
 MODEL_CALL_TIMEOUT = int(os.environ.get("MODEL_CALL_TIMEOUT_SECONDS", "20"))
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "orjson").lower()  # "orjson" or "stdlib"
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))  # -1 disables compression
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "200"))
+EXPORT_MAX_PAGE_SIZE = 1000
+SEARCH_INDEX_CACHE_SIZE = int(os.environ.get("SEARCH_INDEX_CACHE_SIZE", "256"))  # users kept in memory
+SEARCH_INDEX_CACHE_TTL = int(os.environ.get("SEARCH_INDEX_CACHE_TTL_SECONDS", "60"))
+SEARCH_RESULT_LIMIT = 20
+SEARCH_MAX_RESULT_LIMIT = 100
+SEARCH_REPAIR_BATCH = 50
+SEARCH_BUILD_RETRY_SECONDS = int(os.environ.get("SEARCH_BUILD_RETRY_SECONDS", "300"))
+# Upper bound on one full build; another instance may take over a build whose lease has expired.
+SEARCH_BUILD_LEASE_SECONDS = int(os.environ.get("SEARCH_BUILD_LEASE_SECONDS", "600"))
+STATS_DEFAULT_DAYS = 30
+STATS_DEFAULT_WEEKS = 12
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "5000"))
+BULK_MAX_OPS_PER_SECOND = int(os.environ.get("BULK_MAX_OPS_PER_SECOND", "500"))
+BULK_MAX_ATTEMPTS = int(os.environ.get("BULK_MAX_ATTEMPTS", "5"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()  # "json" (Cloud Logging) or "text"
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+# Keep-probability per message template; overridable with a JSON object in LOG_SAMPLE_RATES.
+LOG_SAMPLE_RATES = {
+    "--- Starting API Key Check ---": 0.1,
+    "Found API key: ...%s": 0.1,
+    "--- API Key Check Successful ---": 0.1,
+    # Local rejections: one per request during exactly the floods the limiter absorbs.
+    "Rate limited client IP %s": 0.01,
+    "Rate limited key ...%s": 0.01,
+    "API Key rejected from invalid-key cache: ...%s": 0.01,
+}
+LOG_SAMPLE_RATES.update(json.loads(os.environ.get("LOG_SAMPLE_RATES") or "{}"))
+# Local burst limits checked before any Firestore call (0 rate disables). The app ships
+# one shared key, so the per-key bucket must cover all clients together.
+RATE_LIMIT_KEY_RPS = float(os.environ.get("RATE_LIMIT_KEY_RPS", "50"))
+RATE_LIMIT_KEY_BURST = int(os.environ.get("RATE_LIMIT_KEY_BURST", "100"))
+RATE_LIMIT_IP_RPS = float(os.environ.get("RATE_LIMIT_IP_RPS", "5"))
+RATE_LIMIT_IP_BURST = int(os.environ.get("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", "10000"))
+# Client IP = the Nth X-Forwarded-For entry from the right, N being the number of trusted proxies.
+# Clients come in through API Gateway, so the header reads "<client-supplied...>, client, gateway":
+# the gateway appends the client and Cloud Run's front end appends the gateway's egress address.
+# 0 opts in to the leftmost, client-supplied entry.
+RATE_LIMIT_PROXY_HOPS = int(os.environ.get("RATE_LIMIT_PROXY_HOPS", "2"))
+INVALID_KEY_CACHE_TTL = int(os.environ.get("INVALID_KEY_CACHE_TTL_SECONDS", "60"))
 
 # -----------------------
 # Globals (populated lazily)
@@ -42,14 +112,203 @@ _vertex_initialized = False
 _model = None
 _model_lock = threading.Lock()
 
+# -----------------------
+# JSON encoding (orjson when available, stdlib otherwise)
+# -----------------------
+def _json_default(obj):
+    """Encode the non-JSON types Firestore documents carry."""
+    # DatetimeWithNanoseconds (Firestore timestamps) keeps full precision via rfc3339()
+    if hasattr(obj, "rfc3339"):
+        return obj.rfc3339()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # GeoPoint
+    if hasattr(obj, "latitude") and hasattr(obj, "longitude"):
+        return {"latitude": obj.latitude, "longitude": obj.longitude}
+    # DocumentReference
+    if hasattr(obj, "path") and hasattr(obj, "id"):
+        return obj.path
+    if isinstance(obj, (bytes, bytearray)):
+        import base64
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_json_bytes(obj, encoder=None):
+    """Serialize obj to UTF-8 JSON bytes with the configured (or given) encoder."""
+    encoder = encoder or JSON_ENCODER
+    if encoder == "orjson" and orjson is not None:
+        # PASSTHROUGH_DATETIME routes every datetime through _json_default so
+        # both encoders emit identical timestamps.
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by dumps_json_bytes; used by every jsonify() call."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_json_bytes(obj).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_json_bytes(obj), mimetype=self.mimetype)
+
+# -----------------------
+# Logging: sampled, request-tagged records handed to a background thread
+# -----------------------
+_request_id = contextvars.ContextVar("request_id", default=None)
+_trace = contextvars.ContextVar("trace", default=None)
+_phase_timings = contextvars.ContextVar("phase_timings", default=None)
+_log_listener = None
+
+class RequestContextFilter(logging.Filter):
+    """
+    Drop sampled-out records and stamp the rest with the current request id.
+    Runs in the calling thread, so it must stay cheap: no formatting here.
+    """
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        # Rates are keyed by format string; any other message object is never sampled.
+        rate = self.sample_rates.get(record.msg) if isinstance(record.msg, str) else None
+        if rate is not None and rate < 1 and random.random() >= rate:
+            return False
+        record.request_id = _request_id.get()
+        record.trace = _trace.get()
+        return True
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, in the shape Cloud Logging parses from stdout."""
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "trace", None):
+            entry["logging.googleapis.com/trace"] = f"projects/{PROJECT_ID}/traces/{record.trace}"
+        for key in ("http", "timings"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return dumps_json_bytes(entry).decode("utf-8")
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread. The stock
+    prepare() renders the message in the caller; the queue never leaves this
+    process, so the record can be passed through as-is.
+    """
+
+    def prepare(self, record):
+        return record
+
+def setup_logging(level=None, fmt=None, use_async=None, sample_rates=None, stream=None, force=False):
+    """
+    Configure the root logger: sampling/request-id filter plus JSON or text
+    output, written from a QueueListener thread when use_async. Arguments
+    default to the LOG_* settings; force=True replaces an earlier setup.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    configured = any(isinstance(f, RequestContextFilter) for h in root.handlers for f in h.filters)
+    if configured and not force:
+        return
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+    fmt = fmt or LOG_FORMAT
+    use_async = LOG_ASYNC if use_async is None else use_async
+    stream_handler = logging.StreamHandler(stream)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(request_id)s:%(message)s"))
+
+    if use_async:
+        handler = _DeferredQueueHandler(queue.SimpleQueue())
+        _log_listener = logging.handlers.QueueListener(handler.queue, stream_handler)
+        _log_listener.start()
+    else:
+        handler = stream_handler
+    handler.addFilter(RequestContextFilter(LOG_SAMPLE_RATES if sample_rates is None else sample_rates))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
+
+def _stop_log_listener():
+    if _log_listener is not None:
+        _log_listener.stop()
+
+atexit.register(_stop_log_listener)
+
+@contextmanager
+def timed_phase(name):
+    """Record how long the enclosed block took (ms) in the current request's timings."""
+    timings = _phase_timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
 # -----------------------
 # Flask app + logging
 # -----------------------
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)  # keep this; we also add explicit after_request headers below
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger("sahara-backend")
 
+@app.before_request
+def start_request_context():
+    trace_header = request.headers.get("X-Cloud-Trace-Context", "")
+    trace_id = trace_header.split("/", 1)[0] or None
+    _request_id.set(request.headers.get("X-Request-Id") or trace_id or uuid.uuid4().hex)
+    _trace.set(trace_id)
+    _phase_timings.set({"_start": time.perf_counter()})
+
+# Registered before the other after_request hooks, so it runs last and its timing includes them.
+@app.after_request
+def log_request(response):
+    timings = _phase_timings.get()
+    if timings is not None:
+        start = timings.pop("_start", None)
+        if start is not None:
+            timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(
+            "%s %s -> %s", request.method, request.path, response.status_code,
+            extra={"http": {"method": request.method, "path": request.path, "status": response.status_code},
+                   "timings": timings},
+        )
+        response.headers["X-Request-Id"] = _request_id.get() or ""
+    return response
+
+@app.teardown_request
+def clear_request_context(exc=None):
+    # Worker threads are reused; don't let the next log line inherit this request's id.
+    _request_id.set(None)
+    _trace.set(None)
+    _phase_timings.set(None)
+
 # -----------------------
 # Ensure CORS headers on every response (explicit, hackathon-safe)
 # -----------------------
@@ -62,6 +321,44 @@ def add_cors_headers(response):
     response.headers["Access-Control-Expose-Headers"] = "Content-Type, x-api-key"
     return response
 
+# -----------------------
+# Response compression (negotiated from Accept-Encoding)
+# -----------------------
+_COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html")
+
+def _choose_encoding(accept_encodings):
+    """Pick the best supported content-coding the client accepts, or None."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return accept_encodings.best_match(offered)
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+@app.after_request
+def compress_response(response):
+    if COMPRESS_MIN_BYTES < 0:
+        return response
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in _COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    encoding = _choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
 # Generic OPTIONS responder (ensures preflight receives 204)
 @app.route("/", methods=["OPTIONS"])
 def options_root():
@@ -164,6 +461,93 @@ def check_and_update_global_quota():
         logger.exception("Error updating global quota: %s", e)
         return QUOTA_FAIL_OPEN
 
+# -----------------------
+# Local burst limiting (in front of the Firestore quota)
+# -----------------------
+class TokenBucketLimiter:
+    """
+    Per-key token buckets: `rate` tokens/second refill up to `burst`. State is
+    one [tokens, last_refill] pair per key, with the least recently used keys
+    evicted past max_keys (an evicted key simply starts again with a full bucket).
+    """
+    __slots__ = ("rate", "burst", "max_keys", "_buckets", "_lock")
+
+    def __init__(self, rate, burst, max_keys=RATE_LIMIT_MAX_BUCKETS):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """Take one token for key. Returns 0.0 if allowed, else seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = [float(self.burst), now]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+_key_limiter = TokenBucketLimiter(RATE_LIMIT_KEY_RPS, RATE_LIMIT_KEY_BURST)
+_ip_limiter = TokenBucketLimiter(RATE_LIMIT_IP_RPS, RATE_LIMIT_IP_BURST)
+_invalid_keys = OrderedDict()  # api key -> expiry (monotonic), LRU order
+_invalid_keys_lock = threading.Lock()
+
+def _client_ip(flask_request):
+    """
+    Address the limiter keys on. Only entries appended by trusted proxies are
+    used by default; anything to their left is written by the client.
+    """
+    forwarded = [part.strip() for part in flask_request.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+    if forwarded:
+        if RATE_LIMIT_PROXY_HOPS <= 0:
+            return forwarded[0]
+        return forwarded[max(0, len(forwarded) - RATE_LIMIT_PROXY_HOPS)]
+    return flask_request.remote_addr or ""
+
+def _is_known_invalid_key(api_key):
+    with _invalid_keys_lock:
+        expiry = _invalid_keys.get(api_key)
+        if expiry is None:
+            return False
+        if expiry < time.monotonic():
+            del _invalid_keys[api_key]
+            return False
+        return True
+
+def _remember_invalid_key(api_key):
+    if INVALID_KEY_CACHE_TTL <= 0:
+        return
+    with _invalid_keys_lock:
+        _invalid_keys[api_key] = time.monotonic() + INVALID_KEY_CACHE_TTL
+        _invalid_keys.move_to_end(api_key)
+        while len(_invalid_keys) > RATE_LIMIT_MAX_BUCKETS:
+            _invalid_keys.popitem(last=False)
+
+def _rate_limited(retry_after):
+    # add_retry_after_header turns this into the Retry-After response header.
+    g.retry_after = retry_after
+    return False, ("Too many requests. Please slow down.", 429)
+
+@app.after_request
+def add_retry_after_header(response):
+    retry_after = g.pop("retry_after", None)
+    if response.status_code == 429 and retry_after is not None:
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
 # -----------------------
 # Per-key quota & API key enforcement (transactional)
 # -----------------------
@@ -203,17 +587,33 @@ def require_api_key_and_quota(flask_request):
     if flask_request.method == "OPTIONS":
         return True, None
 
+    # Local checks first: abusive or invalid callers are turned away without a Firestore round trip.
+    client_ip = _client_ip(flask_request)
+    retry_after = _ip_limiter.acquire(client_ip)
+    if retry_after:
+        logger.warning("Rate limited client IP %s", client_ip)
+        return _rate_limited(retry_after)
+
+    api_key = flask_request.headers.get("x-api-key")
+    if api_key:
+        retry_after = _key_limiter.acquire(api_key)
+        if retry_after:
+            logger.warning("Rate limited key ...%s", api_key[-4:])
+            return _rate_limited(retry_after)
+        if _is_known_invalid_key(api_key):
+            logger.warning("API Key rejected from invalid-key cache: ...%s", api_key[-4:])
+            return False, ("Invalid API key.", 403)
+
     init_services_lightweight()
     if not db or FIRESTORE is None:
         logger.error("API Key Check failed: Firestore (db) is not initialized.")
         return False, ("Server not ready to validate key", 503)
 
-    api_key = flask_request.headers.get("x-api-key")
     if not api_key:
         logger.warning("API Key Check failed: Header 'x-api-key' is missing.")
         return False, ("API key is missing.", 401)
 
-    logger.info(f"Found API key: ...{api_key[-4:]}")
+    logger.info("Found API key: ...%s", api_key[-4:])
 
     key_ref = db.collection("api_keys").document(api_key)
     today_str = date.today().isoformat()
@@ -224,17 +624,19 @@ def require_api_key_and_quota(flask_request):
         # decorate the function for transactional execution (FIRESTORE is the module)
         transactional_fn = FIRESTORE.transactional(_transactional_key_update)
         # call the transactional function, passing the transaction object
-        transactional_fn(transaction, key_ref, today_str)
+        with timed_phase("api_key_quota"):
+            transactional_fn(transaction, key_ref, today_str)
 
         logger.info("--- API Key Check Successful ---")
         return True, None
 
     except google_exceptions.NotFound:
-        logger.warning(f"API Key not found in Firestore: ...{api_key[-4:]}")
+        logger.warning("API Key not found in Firestore: ...%s", api_key[-4:])
+        _remember_invalid_key(api_key)
         return False, ("Invalid API key.", 403)
 
     except ValueError as e:
-        logger.warning(f"Quota exceeded for key ...{api_key[-4:]}: {e}")
+        logger.warning("Quota exceeded for key ...%s: %s", api_key[-4:], e)
         return False, (str(e), 429)
 
     except google_exceptions.Aborted as e:
@@ -250,7 +652,7 @@ def require_api_key_and_quota(flask_request):
             return False, ("Internal server error during quota check.", 500)
 
     except Exception as e:
-        logger.exception(f"CRITICAL UNEXPECTED ERROR during quota check for key ...{api_key[-4:]}: {e}")
+        logger.exception("CRITICAL UNEXPECTED ERROR during quota check for key ...%s: %s", api_key[-4:], e)
         return False, ("Internal server error during quota check.", 500)
 
 # -----------------------
@@ -365,6 +767,766 @@ def update_memory_summary_in_background(user_id, prev_memory, user_message, ai_r
     except Exception as e:
         logger.exception("CRITICAL ERROR in background memory update for %s: %s", user_id, e)
 
+# -----------------------
+# Journal search (per-user inverted index)
+# -----------------------
+SEARCHABLE_ENTRY_FIELDS = ("title", "body", "text")
+_TOKEN_RE = re.compile(r"[^\W_]+")  # letters/digits; no '_' so terms are always valid map keys
+_MAX_TOKEN_LEN = 40
+
+def tokenize(text):
+    """Lower-cased word tokens of text (single characters dropped)."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if 1 < len(t) <= _MAX_TOKEN_LEN]
+
+def entry_terms(entry):
+    terms = set()
+    for field in SEARCHABLE_ENTRY_FIELDS:
+        value = (entry or {}).get(field)
+        if isinstance(value, str):
+            terms.update(tokenize(value))
+    return terms
+
+def _encode_postings(ordinals, base=0):
+    """Delta + varint encode a sorted sequence of ints >= base."""
+    out = bytearray()
+    prev = base
+    for n in ordinals:
+        delta = n - prev
+        prev = n
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+def _decode_postings(data, base=0):
+    ordinals = array("I")
+    value = shift = 0
+    prev = base
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += value
+        ordinals.append(prev)
+        value = shift = 0
+    return ordinals
+
+SEARCH_INDEX_COLLECTION = "search_index"
+# Entries per block. Postings are sharded by (block, term prefix), so a write
+# only ever touches documents of one block and per-write cost stays bounded no
+# matter how many entries a user has.
+SEARCH_BLOCK_SIZE = 512
+_SEARCH_BUCKETS = tuple("abcdefghijklmnopqrstuvwxyz0123456789_")
+
+def term_bucket(term):
+    """Shard bucket for a term: its first character if ASCII a-z/0-9, else "_"."""
+    first = term[0]
+    return first if first in _SEARCH_BUCKETS else "_"
+
+def search_block(ordinal):
+    return ordinal // SEARCH_BLOCK_SIZE
+
+def apply_entry_terms(shards, block, ordinal, old_terms, new_terms):
+    """
+    Move ordinal from old_terms to new_terms within block's postings shards.
+
+    shards maps bucket -> {term: sorted array of ordinals} and is mutated in
+    place; missing buckets are created. old_terms=None means "unknown": the
+    ordinal is scrubbed from every term in the given shards. Returns the set
+    of buckets that changed.
+    """
+    changed = set()
+    if old_terms is None:
+        for bucket, postings in shards.items():
+            for term in [t for t, ords in postings.items() if ordinal in ords]:
+                _remove_posting(postings, term, ordinal)
+                changed.add(bucket)
+        old_terms = set()
+    else:
+        for term in old_terms - new_terms:
+            bucket = term_bucket(term)
+            if _remove_posting(shards.setdefault(bucket, {}), term, ordinal):
+                changed.add(bucket)
+    for term in new_terms - old_terms:
+        bucket = term_bucket(term)
+        postings = shards.setdefault(bucket, {})
+        ords = postings.get(term)
+        if ords is None:
+            postings[term] = array("I", [ordinal])
+        elif ords[-1] < ordinal:
+            ords.append(ordinal)
+        else:
+            i = bisect.bisect_left(ords, ordinal)
+            if i < len(ords) and ords[i] == ordinal:
+                continue
+            ords.insert(i, ordinal)
+        changed.add(bucket)
+    return changed
+
+def _remove_posting(postings, term, ordinal):
+    ords = postings.get(term)
+    if not ords:
+        return False
+    i = bisect.bisect_left(ords, ordinal)
+    if i == len(ords) or ords[i] != ordinal:
+        return False
+    del ords[i]
+    if not ords:
+        del postings[term]
+    return True
+
+def _shard_to_firestore(postings, block):
+    base = block * SEARCH_BLOCK_SIZE
+    return {"postings": {term: _encode_postings(ords, base) for term, ords in postings.items()}}
+
+def _shard_from_firestore(data, block):
+    base = block * SEARCH_BLOCK_SIZE
+    return {term: _decode_postings(blob, base) for term, blob in ((data or {}).get("postings") or {}).items()}
+
+def _ids_from_firestore(data):
+    blob = (data or {}).get("ids") or b""
+    return bytes(blob).decode("utf-8").split("\n") if blob else []
+
+def _ids_to_firestore(ids):
+    return {"ids": "\n".join(ids).encode("utf-8")}
+
+class JournalSearchIndex:
+    """
+    In-memory view of one user's sharded index.
+
+    Layout under users/<id>/search_index/:
+      meta                  next_ordinal, generation, built (building, build_lease_until during a build)
+      g<gen>-ids-<block>    entry ids of the block, in ordinal order
+      g<gen>-p-<block>-<b>  postings of terms in bucket b: term -> delta/varint bytes
+
+    Shards and id blocks are loaded on demand and then kept until the cache
+    entry expires.
+    """
+    __slots__ = ("generation", "next_ordinal", "shards", "id_blocks", "loaded_at")
+
+    def __init__(self, generation, next_ordinal=0):
+        self.generation = generation
+        self.next_ordinal = next_ordinal
+        self.shards = {}     # (block, bucket) -> {term: array of ordinals}
+        self.id_blocks = {}  # block -> [entry ids]
+        self.loaded_at = time.monotonic()
+
+    @property
+    def block_count(self):
+        return -(-self.next_ordinal // SEARCH_BLOCK_SIZE)
+
+    def shard_keys_for(self, query):
+        buckets = {term_bucket(t) for t in tokenize(query)}
+        return {(block, bucket) for block in range(self.block_count) for bucket in buckets}
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """
+        Ordinals of entries matching every query term (the last term also
+        matches as a prefix, for search-as-you-type), newest first. Shards
+        not loaded are treated as empty.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        *exact, last = tokens
+        bucket_of_last = term_bucket(last)
+        found = []
+        for block in range(self.block_count - 1, -1, -1):
+            result = set()
+            for term, ords in self.shards.get((block, bucket_of_last), {}).items():
+                if term.startswith(last):
+                    result.update(ords)
+            for term in exact:
+                if not result:
+                    break
+                result.intersection_update(self.shards.get((block, term_bucket(term)), {}).get(term, ()))
+            found.extend(sorted(result, reverse=True))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def entry_ids(self, ordinals):
+        ids = []
+        for ordinal in ordinals:
+            block_ids = self.id_blocks.get(search_block(ordinal), [])
+            slot = ordinal % SEARCH_BLOCK_SIZE
+            if slot < len(block_ids) and block_ids[slot]:
+                ids.append(block_ids[slot])
+        return ids
+
+class SearchIndexUnavailable(Exception):
+    """The index could not be built recently; callers should not retry a full scan yet."""
+
+_search_cache = OrderedDict()  # user_id -> JournalSearchIndex, LRU order
+_search_cache_lock = threading.Lock()
+_search_build_failures = {}  # user_id -> monotonic time of the last failed build
+_search_builds_running = set()  # user_ids with a build in progress on this instance
+
+def _search_cache_get(user_id):
+    with _search_cache_lock:
+        index = _search_cache.get(user_id)
+        if index is None:
+            return None
+        if time.monotonic() - index.loaded_at > SEARCH_INDEX_CACHE_TTL:
+            # Another instance may have written since; reload from Firestore.
+            del _search_cache[user_id]
+            return None
+        _search_cache.move_to_end(user_id)
+        return index
+
+def _search_cache_put(user_id, index):
+    with _search_cache_lock:
+        _search_cache[user_id] = index
+        _search_cache.move_to_end(user_id)
+        while len(_search_cache) > SEARCH_INDEX_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+def _search_index_coll(user_id):
+    return db.collection("users").document(user_id).collection(SEARCH_INDEX_COLLECTION)
+
+def _search_meta_ref(user_id):
+    return _search_index_coll(user_id).document("meta")
+
+def _search_shard_ref(user_id, generation, block, bucket):
+    return _search_index_coll(user_id).document(f"g{generation}-p-{block}-{bucket}")
+
+def _search_ids_ref(user_id, generation, block):
+    return _search_index_coll(user_id).document(f"g{generation}-ids-{block}")
+
+# gRPC FAILED_PRECONDITION: the entry changed after the build read it.
+_FAILED_PRECONDITION = 9
+
+def build_search_index(user_id, generation):
+    """
+    One-off full build from the entries subcollection (users indexed before
+    search existed), run by whoever holds the build lease for generation.
+    Streams entries and writes each block's shards as soon as it fills, so
+    memory is bounded by one block. Every entry is stamped with its
+    searchOrdinal and searchGeneration; searchPending is cleared only if the
+    entry is unchanged since it was read, so entries edited mid-build stay
+    pending and repair re-indexes them. Shards are written under the new
+    generation and meta is published last, only if the lease is still ours,
+    so a failed or superseded build leaves nothing that is ever read.
+    """
+    entries_ref = db.collection("users").document(user_id).collection("entries")
+    writer = db.bulk_writer()
+    failures = []
+    changed = {}  # entry path -> (ref, ordinal) of entries edited after the scan read them
+    stamped = {}
+
+    def on_error(failure, bulk_writer):
+        path = failure.operation.reference.path
+        if failure.code == _FAILED_PRECONDITION and path in stamped:
+            changed[path] = stamped[path]
+            return False
+        retry = failure.code in _BULK_RETRYABLE_CODES and failure.attempts + 1 < BULK_MAX_ATTEMPTS
+        if not retry:
+            failures.append(failure)
+        return retry
+
+    writer.on_write_error(on_error)
+    shards, ids, ordinal = {}, [], 0
+
+    def flush_block(block):
+        for bucket, postings in shards.items():
+            writer.set(_search_shard_ref(user_id, generation, block, bucket), _shard_to_firestore(postings, block))
+        writer.set(_search_ids_ref(user_id, generation, block), _ids_to_firestore(ids))
+
+    query = entries_ref.order_by("dateAdded").select(list(SEARCHABLE_ENTRY_FIELDS))
+    for doc in query.stream():
+        if ordinal and ordinal % SEARCH_BLOCK_SIZE == 0:
+            flush_block(search_block(ordinal) - 1)
+            shards, ids = {}, []
+        apply_entry_terms(shards, search_block(ordinal), ordinal, set(), entry_terms(doc.to_dict()))
+        ids.append(doc.id)
+        stamped[doc.reference.path] = (doc.reference, ordinal)
+        writer.update(
+            doc.reference,
+            {"searchOrdinal": ordinal, "searchGeneration": generation, "searchPending": FIRESTORE.DELETE_FIELD},
+            option=db.write_option(last_update_time=doc.update_time),
+        )
+        ordinal += 1
+    if ids:
+        flush_block(search_block(ordinal - 1))
+    writer.close()
+    if failures:
+        # Leave meta unpublished; the next build starts over under a new generation.
+        raise RuntimeError(f"{len(failures)} search index write(s) failed: {failures[0].message}")
+
+    # Edited entries still get their ordinal (the index holds the terms that
+    # were read), but keep whatever searchPending flag the edit set. This runs
+    # before meta is published, so no incremental update can race it.
+    for ref, entry_ordinal in changed.values():
+        try:
+            ref.update({"searchOrdinal": entry_ordinal, "searchGeneration": generation})
+        except google_exceptions.NotFound:
+            pass  # deleted mid-build; searches skip ids that no longer exist
+
+    transaction = db.transaction()
+    published = FIRESTORE.transactional(_transactional_publish_search_build)(transaction, _search_meta_ref(user_id), generation, ordinal)
+    if not published:
+        raise RuntimeError(f"Search index build {generation} for user {user_id} lost its lease")
+    logger.info("Built search index for user %s (%s entries, %s changed mid-build)", user_id, ordinal, len(changed))
+    return JournalSearchIndex(generation, ordinal)
+
+def _transactional_claim_search_build(transaction, meta_ref, generation):
+    """
+    Take the build lease unless the index is built or another build holds an
+    unexpired lease. Returns the meta dict when built, True when claimed, and
+    False when someone else is building.
+    """
+    snap = meta_ref.get(transaction=transaction)
+    meta = (snap.to_dict() or {}) if snap.exists else {}
+    if meta.get("built"):
+        return meta
+    if meta.get("build_lease_until", 0) > time.time():
+        return False
+    transaction.set(meta_ref, {
+        "built": False,
+        "building": generation,
+        "build_lease_until": time.time() + SEARCH_BUILD_LEASE_SECONDS,
+    })
+    return True
+
+def _transactional_publish_search_build(transaction, meta_ref, generation, next_ordinal):
+    snap = meta_ref.get(transaction=transaction)
+    meta = (snap.to_dict() or {}) if snap.exists else {}
+    if meta.get("built") or meta.get("building") != generation:
+        return False
+    transaction.set(meta_ref, {
+        "generation": generation,
+        "next_ordinal": next_ordinal,
+        "built": True,
+        "updated": FIRESTORE.SERVER_TIMESTAMP,
+    })
+    return True
+
+def _transactional_index_update(transaction, user_id, entry_ref, old_entry):
+    """
+    Index the entry's stored content inside a transaction, reading and writing
+    only the documents of the entry's block. An entry without a searchOrdinal of the
+    current generation is added as new; otherwise old_entry=None scrubs it
+    from every bucket of its block first (its indexed terms are unknown).
+    Stamps the entry and clears its searchPending flag. Returns (generation,
+    next_ordinal, block, {bucket: postings}, ids or None), or None if the
+    index is not built yet or the entry is gone.
+    """
+    meta_snap = _search_meta_ref(user_id).get(transaction=transaction)
+    meta = (meta_snap.to_dict() or {}) if meta_snap.exists else {}
+    if not meta.get("built"):
+        # The first search builds it from the subcollection, including this entry.
+        return None
+    entry_snap = entry_ref.get(transaction=transaction)
+    if not entry_snap.exists:
+        return None
+    stored = entry_snap.to_dict() or {}
+    generation = meta["generation"]
+    next_ordinal = int(meta.get("next_ordinal") or 0)
+
+    ordinal = stored.get("searchOrdinal") if stored.get("searchGeneration") == generation else None
+    is_new = ordinal is None or ordinal >= next_ordinal
+    if is_new:
+        ordinal = next_ordinal
+    block = search_block(ordinal)
+    new_terms = entry_terms(stored)
+    if is_new:
+        old_terms = set()
+        buckets = {term_bucket(t) for t in new_terms}
+    elif old_entry is None:
+        old_terms = None
+        buckets = set(_SEARCH_BUCKETS)
+    else:
+        old_terms = entry_terms(old_entry)
+        buckets = {term_bucket(t) for t in old_terms ^ new_terms}
+
+    refs = {bucket: _search_shard_ref(user_id, generation, block, bucket) for bucket in buckets}
+    by_id = {snap.id: snap for snap in db.get_all(list(refs.values()), transaction=transaction)}
+    shards = {}
+    for bucket, ref in refs.items():
+        snap = by_id.get(ref.id)
+        shards[bucket] = _shard_from_firestore(snap.to_dict() if snap is not None and snap.exists else None, block)
+    ids = None
+    if is_new:
+        ids_snap = _search_ids_ref(user_id, generation, block).get(transaction=transaction)
+        ids = _ids_from_firestore(ids_snap.to_dict() if ids_snap.exists else None)
+
+    for bucket in apply_entry_terms(shards, block, ordinal, old_terms, new_terms):
+        transaction.set(refs[bucket], _shard_to_firestore(shards[bucket], block))
+    if is_new:
+        slot = ordinal % SEARCH_BLOCK_SIZE
+        ids.extend([""] * (slot + 1 - len(ids)))
+        ids[slot] = entry_ref.id
+        transaction.set(_search_ids_ref(user_id, generation, block), _ids_to_firestore(ids))
+        next_ordinal = ordinal + 1
+        transaction.update(_search_meta_ref(user_id), {"next_ordinal": next_ordinal, "updated": FIRESTORE.SERVER_TIMESTAMP})
+    transaction.update(entry_ref, {
+        "searchOrdinal": ordinal,
+        "searchGeneration": generation,
+        "searchPending": FIRESTORE.DELETE_FIELD,
+    })
+    return generation, next_ordinal, block, shards, ids
+
+def indexed_entry_version(stored_entry):
+    """
+    The stored entry if its terms are what the index holds, else None. An
+    entry still searchPending had a failed update, so the index may hold an
+    older version's terms and they must be scrubbed rather than diffed.
+    """
+    return None if stored_entry.get("searchPending") else stored_entry
+
+def update_search_index(user_id, entry_ref, old_entry=None):
+    """
+    Best-effort incremental index update after an entry write; never raises.
+    Writers mark the entry searchPending first, so an entry whose update fails
+    here stays pending and is picked up by repair_search_index.
+    """
+    try:
+        transaction = db.transaction()
+        transactional_fn = FIRESTORE.transactional(_transactional_index_update)
+        result = transactional_fn(transaction, user_id, entry_ref, old_entry)
+    except Exception as e:
+        logger.exception("Failed to update search index for user %s entry %s: %s", user_id, entry_ref.id, e)
+        with _search_cache_lock:
+            _search_cache.pop(user_id, None)
+        return False
+    if result is None:
+        return False
+    generation, next_ordinal, block, shards, ids = result
+    with _search_cache_lock:
+        index = _search_cache.get(user_id)
+        if index is not None and index.generation == generation:
+            # The shards read inside the transaction are complete, so they can replace cached copies.
+            for bucket, postings in shards.items():
+                index.shards[(block, bucket)] = postings
+            if ids is not None:
+                index.id_blocks[block] = ids
+            index.next_ordinal = max(index.next_ordinal, next_ordinal)
+    return True
+
+def repair_search_index(user_id, limit=SEARCH_REPAIR_BATCH):
+    """Re-index entries left searchPending by a failed update. Returns how many were repaired."""
+    entries_ref = db.collection("users").document(user_id).collection("entries")
+    repaired = 0
+    for doc in entries_ref.where("searchPending", "==", True).limit(limit).stream():
+        # Old terms are unknown here, so an already-indexed entry is scrubbed from its block first.
+        if update_search_index(user_id, doc.reference, old_entry=None):
+            repaired += 1
+    if repaired:
+        logger.info("Repaired %s pending search index entries for user %s", repaired, user_id)
+    return repaired
+
+def _claim_and_build_search_index(user_id):
+    """
+    Build the index unless a build is already running for user_id, here or on
+    another instance (SearchIndexUnavailable), or failed within the last
+    SEARCH_BUILD_RETRY_SECONDS (also SearchIndexUnavailable, instead of
+    rescanning on every search).
+    """
+    failed_at = _search_build_failures.get(user_id)
+    if failed_at is not None and time.monotonic() - failed_at < SEARCH_BUILD_RETRY_SECONDS:
+        raise SearchIndexUnavailable(user_id)
+    generation = int(time.time() * 1000)
+    transaction = db.transaction()
+    claimed = FIRESTORE.transactional(_transactional_claim_search_build)(transaction, _search_meta_ref(user_id), generation)
+    if isinstance(claimed, dict):
+        return JournalSearchIndex(claimed["generation"], int(claimed.get("next_ordinal") or 0))
+    if not claimed:
+        raise SearchIndexUnavailable(user_id)
+    try:
+        index = build_search_index(user_id, generation)
+    except Exception:
+        _search_build_failures[user_id] = time.monotonic()
+        raise
+    _search_build_failures.pop(user_id, None)
+    return index
+
+def load_search_index(user_id):
+    """
+    Cached index for user_id (meta only; shards load on demand). Builds it on
+    first use; concurrent first searches for the same user get
+    SearchIndexUnavailable rather than a second full scan. Pending entries
+    are repaired whenever the meta doc is (re)loaded.
+    """
+    index = _search_cache_get(user_id)
+    if index is not None:
+        return index
+
+    snap = _search_meta_ref(user_id).get()
+    meta = (snap.to_dict() or {}) if snap.exists else {}
+    if meta.get("built"):
+        index = JournalSearchIndex(meta["generation"], int(meta.get("next_ordinal") or 0))
+    else:
+        with _search_cache_lock:
+            if user_id in _search_builds_running:
+                raise SearchIndexUnavailable(user_id)
+            _search_builds_running.add(user_id)
+        try:
+            index = _claim_and_build_search_index(user_id)
+        finally:
+            with _search_cache_lock:
+                _search_builds_running.discard(user_id)
+    _search_cache_put(user_id, index)
+    repair_search_index(user_id)
+    return index
+
+def search_journal(user_id, query, limit=SEARCH_RESULT_LIMIT):
+    """Entry ids matching query, newest first, loading only the shards and id blocks it needs."""
+    index = load_search_index(user_id)
+    missing = [key for key in index.shard_keys_for(query) if key not in index.shards]
+    if missing:
+        refs = {_search_shard_ref(user_id, index.generation, block, bucket).id: (block, bucket) for block, bucket in missing}
+        loaded = {key: {} for key in missing}
+        coll = _search_index_coll(user_id)
+        for snap in db.get_all([coll.document(doc_id) for doc_id in refs]):
+            if snap.exists:
+                block, bucket = refs[snap.id]
+                loaded[(block, bucket)] = _shard_from_firestore(snap.to_dict(), block)
+        index.shards.update(loaded)
+
+    ordinals = index.search(query, limit=limit)
+    blocks = {search_block(o) for o in ordinals} - set(index.id_blocks)
+    if blocks:
+        refs = {_search_ids_ref(user_id, index.generation, block).id: block for block in blocks}
+        loaded = {block: [] for block in blocks}
+        coll = _search_index_coll(user_id)
+        for snap in db.get_all([coll.document(doc_id) for doc_id in refs]):
+            if snap.exists:
+                loaded[refs[snap.id]] = _ids_from_firestore(snap.to_dict())
+        index.id_blocks.update(loaded)
+    return index.entry_ids(ordinals)
+
+# -----------------------
+# Activity rollups (daily/weekly counters, one doc per user)
+# -----------------------
+STATS_COUNTERS = ("entries", "journey_completed", "conversations")
+
+def _stats_ref(user_id):
+    return db.collection("users").document(user_id).collection("stats").document("rollups")
+
+def _week_key(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+def _rollup_fields(deltas, day):
+    """Merge-write payload adding deltas to the totals and to day's daily/weekly buckets."""
+    increments = {name: FIRESTORE.Increment(n) for name, n in deltas.items()}
+    return {
+        "totals": increments,
+        "daily": {day.isoformat(): increments},
+        "weekly": {_week_key(day): increments},
+        "updated": FIRESTORE.SERVER_TIMESTAMP,
+    }
+
+def record_activity(user_id, **deltas):
+    """
+    Best-effort increment of the user's rollup counters (totals, today, this
+    ISO week) with a single merge write; never raises.
+    """
+    deltas = {name: n for name, n in deltas.items() if n}
+    if not deltas or not db or FIRESTORE is None:
+        return
+    try:
+        _stats_ref(user_id).set(_rollup_fields(deltas, datetime.now(timezone.utc).date()), merge=True)
+    except Exception as e:
+        logger.exception("Failed to record activity %s for user %s: %s", deltas, user_id, e)
+
+def _transactional_journey_update(transaction, item_ref, stats_ref, data):
+    """
+    Apply a journey item update and its journey_completed rollup change
+    atomically. Completing stamps the item with completedAt (UTC date) and
+    counts it on that day; un-completing takes it back off that same day's
+    buckets, so no day ever goes negative. Items completed before completedAt
+    existed are not decremented. Returns False if the item does not exist.
+    """
+    snapshot = item_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+
+    update = {k: v for k, v in data.items() if k != "completedAt"}  # server-owned
+    if "isCompleted" in update:
+        current = snapshot.to_dict() or {}
+        was_completed = _as_bool(current.get("isCompleted"))
+        now_completed = _as_bool(update["isCompleted"])
+        if now_completed and not was_completed:
+            today = datetime.now(timezone.utc).date()
+            update["completedAt"] = today.isoformat()
+            transaction.set(stats_ref, _rollup_fields({"journey_completed": 1}, today), merge=True)
+        elif was_completed and not now_completed:
+            update["completedAt"] = FIRESTORE.DELETE_FIELD
+            try:
+                completed_on = date.fromisoformat(current.get("completedAt") or "")
+            except (TypeError, ValueError):
+                completed_on = None
+            if completed_on is not None:
+                transaction.set(stats_ref, _rollup_fields({"journey_completed": -1}, completed_on), merge=True)
+
+    if update:
+        transaction.update(item_ref, update)
+    return True
+
+def _transactional_journey_create(transaction, item_ref, stats_ref, item):
+    """
+    Create a journey item under a client-chosen id and count it in the
+    rollups atomically, so concurrent retries with the same id create and
+    count it once. Returns False if the item already exists.
+    """
+    if item_ref.get(transaction=transaction).exists:
+        return False
+    transaction.create(item_ref, item)
+    if item.get("isCompleted"):
+        completed_on = date.fromisoformat(item["completedAt"])
+        transaction.set(stats_ref, _rollup_fields({"journey_completed": 1}, completed_on), merge=True)
+    return True
+
+def _counters(bucket):
+    bucket = bucket or {}
+    return {name: int(bucket.get(name, 0)) for name in STATS_COUNTERS}
+
+# -----------------------
+# Bulk resource import (BulkWriter)
+# -----------------------
+# gRPC status codes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, ABORTED, UNAVAILABLE
+_BULK_RETRYABLE_CODES = (4, 8, 10, 14)
+
+def _loads_json(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def parse_bulk_payload(raw, content_type=""):
+    """
+    Parse a bulk body: a JSON array, or NDJSON (one object per line). NDJSON is
+    used when content_type says so or the body does not start with '['.
+    Raises ValueError on malformed input.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    body = raw.strip()
+    if not body:
+        raise ValueError("Empty body.")
+    if "ndjson" not in (content_type or "") and body.startswith(b"["):
+        try:
+            items = _loads_json(body)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON array: {e}")
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array.")
+        return items
+    items = []
+    for lineno, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(_loads_json(line))
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {lineno}: {e}")
+    return items
+
+def _is_reserved_name(name):
+    return name.startswith("__") and name.endswith("__")
+
+def validate_resource_item(item):
+    """
+    Validate one bulk item and return (op, doc_id, data).
+
+    Items are article documents as returned by GET /resources: an optional
+    "id" plus fields. {"id": ..., "_delete": true} deletes the article.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Item must be a JSON object.")
+    item = dict(item)
+    doc_id = item.pop("id", None)
+    delete = item.pop("_delete", False)
+    if doc_id is not None:
+        if not isinstance(doc_id, str) or not doc_id or "/" in doc_id or doc_id in (".", "..") \
+                or _is_reserved_name(doc_id) or len(doc_id.encode("utf-8")) > 1500:
+            raise ValueError(f"Invalid id: {doc_id!r}")
+    if delete is True:
+        if doc_id is None:
+            raise ValueError("Delete requires an id.")
+        return "delete", doc_id, None
+    if delete is not False:
+        raise ValueError("'_delete' must be a boolean.")
+    if not item:
+        raise ValueError("Upsert requires at least one field.")
+    for key in item:
+        if not key or _is_reserved_name(key):
+            raise ValueError(f"Invalid field name: {key!r}")
+    return "upsert", doc_id, item
+
+def validate_resource_items(items):
+    """Validate all items up front; returns (ops, errors) where errors is a list of per-item results."""
+    ops, errors, seen = [], [], set()
+    if len(items) > BULK_MAX_ITEMS:
+        return [], [{"index": None, "status": "invalid", "error": f"Too many items (max {BULK_MAX_ITEMS})."}]
+    for index, item in enumerate(items):
+        try:
+            op, doc_id, data = validate_resource_item(item)
+            if doc_id is not None:
+                if doc_id in seen:
+                    raise ValueError(f"Duplicate id in payload: {doc_id!r}")
+                seen.add(doc_id)
+        except ValueError as e:
+            errors.append({"index": index, "id": item.get("id") if isinstance(item, dict) else None,
+                           "status": "invalid", "error": str(e)})
+            continue
+        ops.append((index, op, doc_id, data))
+    return ops, errors
+
+def bulk_write_resources(ops, replace=False):
+    """
+    Apply validated (index, op, doc_id, data) operations to the articles
+    collection through a BulkWriter. Upserts merge unless replace=True.
+    Retryable failures (contention, throttling) are retried up to
+    BULK_MAX_ATTEMPTS times. Returns per-item results ordered by index.
+    """
+    from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+    articles = db.collection("articles")
+    results = {}
+    by_path = {}
+    lock = threading.Lock()
+
+    def on_result(reference, write_result, bulk_writer):
+        with lock:
+            results[by_path[reference.path]]["status"] = "ok"
+
+    def on_error(failure, bulk_writer):
+        retry = failure.code in _BULK_RETRYABLE_CODES and failure.attempts + 1 < BULK_MAX_ATTEMPTS
+        if not retry:
+            with lock:
+                result = results[by_path[failure.operation.reference.path]]
+                result["status"] = "error"
+                result["error"] = failure.message or f"gRPC status {failure.code}"
+        return retry
+
+    writer = db.bulk_writer(options=BulkWriterOptions(
+        initial_ops_per_second=min(500, BULK_MAX_OPS_PER_SECOND),
+        max_ops_per_second=BULK_MAX_OPS_PER_SECOND,
+    ))
+    writer.on_write_result(on_result)
+    writer.on_write_error(on_error)
+    for index, op, doc_id, data in ops:
+        ref = articles.document(doc_id) if doc_id else articles.document()
+        by_path[ref.path] = index
+        results[index] = {"index": index, "id": ref.id, "op": op, "status": "pending"}
+        if op == "delete":
+            writer.delete(ref)
+        else:
+            writer.set(ref, data, merge=not replace)
+    writer.close()  # flushes and waits for every write (including retries)
+
+    for result in results.values():
+        if result["status"] == "pending":
+            result["status"] = "error"
+            result["error"] = "No write result received."
+    return [results[index] for index in sorted(results)]
+
 # -----------------------
 # Endpoints
 # -----------------------
@@ -442,7 +1604,8 @@ def handle_chat():
     full_prompt = f"{system_prompt}\n{few_shot}\n{context_prompt}\n\nUser: {user_message}\nAastha:"
 
     # Call model
-    ai_reply = _generate_text_from_model(full_prompt)
+    with timed_phase("model"):
+        ai_reply = _generate_text_from_model(full_prompt)
 
     payload = {}  # Initialize an empty payload dictionary
 
@@ -490,6 +1653,7 @@ def handle_chat():
                 "last_active": FIRESTORE.SERVER_TIMESTAMP,
                 "conversation_count": FIRESTORE.Increment(1)
             }, merge=True)
+            record_activity(user_id, conversations=1)
     except Exception as e:
         logger.exception("Warning: Failed to update user doc post-chat for %s: %s", user_id, e)
 
@@ -599,6 +1763,44 @@ def delete_resource(resource_id):
         logger.exception("Error deleting resource %s: %s", resource_id, e)
         return jsonify({"error": "Could not delete resource"}), 500 
 
+@app.route("/resources/bulk", methods=["POST"])
+def bulk_upsert_resources():
+    """Bulk upsert/delete articles from a JSON array or NDJSON body (?mode=merge|replace)."""
+    init_firestore()
+    ok, info = require_api_key_and_quota(request)
+    if not ok:
+        msg, code = info
+        return jsonify({"error": msg}), code
+
+    if not db:
+        return jsonify({"error": "Server not ready"}), 503
+
+    mode = (request.args.get("mode") or "merge").lower()
+    if mode not in ("merge", "replace"):
+        return jsonify({"error": "mode must be 'merge' or 'replace'"}), 400
+
+    try:
+        items = parse_bulk_payload(request.get_data(), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ops, errors = validate_resource_items(items)
+    if errors:
+        # Nothing is written unless the whole payload is valid.
+        return jsonify({"error": "Validation failed", "results": errors}), 400
+    if not ops:
+        return jsonify({"error": "No items to write"}), 400
+
+    try:
+        results = bulk_write_resources(ops, replace=(mode == "replace"))
+    except Exception as e:
+        logger.exception("Bulk resource write failed: %s", e)
+        return jsonify({"error": "Bulk write failed"}), 500
+
+    failed = sum(1 for r in results if r["status"] != "ok")
+    logger.info("Bulk resource write: %s items, %s failed", len(results), failed)
+    return jsonify({"written": len(results) - failed, "failed": failed, "results": results}), (207 if failed else 200)
+
 @app.route("/journal/sync", methods=["POST"])
 def handle_journal_sync():
     init_firestore()
@@ -622,7 +1824,11 @@ def handle_journal_sync():
     try:
         entry_payload = entry.copy() if isinstance(entry, dict) else {"text": str(entry)}
         entry_payload["dateAdded"] = FIRESTORE.SERVER_TIMESTAMP
-        db.collection("users").document(user_id).collection("entries").add(entry_payload)
+        entry_payload["searchPending"] = True
+        doc_ref = db.collection("users").document(user_id).collection("entries").document()
+        doc_ref.set(entry_payload)
+        update_search_index(user_id, doc_ref)
+        record_activity(user_id, entries=1)
         return jsonify({"status": "success"}), 200
     except Exception as e:
         logger.exception("Error syncing journal: %s", e)
@@ -663,15 +1869,18 @@ def add_journey_item(user_id):
             "isCompleted": bool(data.get("isCompleted", False)),
             "dateAdded": FIRESTORE.SERVER_TIMESTAMP
         }
+        if journey_item["isCompleted"]:
+            journey_item["completedAt"] = datetime.now(timezone.utc).date().isoformat()
 
         coll_ref = db.collection("users").document(user_id).collection("journey")
 
         if client_id:
             doc_ref = coll_ref.document(client_id)
-            if doc_ref.get().exists:
+            transaction = db.transaction()
+            transactional_fn = FIRESTORE.transactional(_transactional_journey_create)
+            if not transactional_fn(transaction, doc_ref, _stats_ref(user_id), journey_item):
                 logger.info("add_journey_item: item with clientId %s already exists", client_id)
                 return jsonify({"status": "exists", "id": doc_ref.id}), 200
-            doc_ref.set(journey_item)
             return jsonify({"status": "success", "id": doc_ref.id}), 201
 
         # No client_id: use add() but handle different return shapes
@@ -690,10 +1899,11 @@ def add_journey_item(user_id):
             logger.exception("add_journey_item: Could not determine DocumentReference from add() result: %s", add_result)
             return jsonify({"status": "error", "message": "Created item but could not determine its id."}), 500
 
+        record_activity(user_id, journey_completed=int(journey_item["isCompleted"]))
         return jsonify({"status": "success", "id": doc_ref.id}), 201
 
     except Exception as e:
-        logger.exception(f"Error adding journey item for user {user_id}: {e}")
+        logger.exception("Error adding journey item for user %s: %s", user_id, e)
         return jsonify({"status": "error", "message": "Could not add item"}), 500
 
 @app.route("/users/<user_id>/journey", methods=["GET"])
@@ -712,7 +1922,7 @@ def get_journey_items(user_id):
         items = [{**doc.to_dict(), "id": doc.id} for doc in docs]
         return jsonify(items)
     except Exception as e:
-        logger.exception(f"Error fetching journey for user {user_id}: {e}")
+        logger.exception("Error fetching journey for user %s: %s", user_id, e)
         return jsonify([]), 500
 
 @app.route("/users/<user_id>/journey/<item_id>", methods=["PUT"])
@@ -726,14 +1936,48 @@ def update_journey_item(user_id, item_id):
     data = request.get_json(silent=True) or {}
     try:
         doc_ref = db.collection("users").document(user_id).collection("journey").document(item_id)
-        if not doc_ref.get().exists:
+        transaction = db.transaction()
+        transactional_fn = FIRESTORE.transactional(_transactional_journey_update)
+        if not transactional_fn(transaction, doc_ref, _stats_ref(user_id), data):
             return jsonify({"error": "Journey item not found"}), 404
-        doc_ref.update(data)
         return jsonify({"status": "success"}), 200
     except Exception as e:
         logger.exception("Error updating journey item: %s", e)
         return jsonify({"error": "Could not update item"}), 500 
 
+@app.route("/users/<user_id>/stats", methods=["GET"])
+def get_user_stats(user_id):
+    """Activity totals plus the last `days` daily and `weeks` weekly buckets, from one rollup doc."""
+    init_firestore()
+    ok, info = require_api_key_and_quota(request)
+    if not ok:
+        msg, code = info
+        return jsonify({"error": msg}), code
+
+    days = max(1, min(request.args.get("days", default=STATS_DEFAULT_DAYS, type=int) or STATS_DEFAULT_DAYS, 366))
+    weeks = max(1, min(request.args.get("weeks", default=STATS_DEFAULT_WEEKS, type=int) or STATS_DEFAULT_WEEKS, 53))
+
+    try:
+        doc = _stats_ref(user_id).get()
+        rollups = (doc.to_dict() or {}) if doc.exists else {}
+        daily, weekly = rollups.get("daily") or {}, rollups.get("weekly") or {}
+        today = datetime.now(timezone.utc).date()
+
+        daily_out = []
+        for offset in range(days - 1, -1, -1):
+            key = (today - timedelta(days=offset)).isoformat()
+            daily_out.append({"date": key, **_counters(daily.get(key))})
+
+        weekly_out = []
+        for offset in range(weeks - 1, -1, -1):
+            key = _week_key(today - timedelta(weeks=offset))
+            weekly_out.append({"week": key, **_counters(weekly.get(key))})
+
+        return jsonify({"totals": _counters(rollups.get("totals")), "daily": daily_out, "weekly": weekly_out}), 200
+    except Exception as e:
+        logger.exception("Error fetching stats for %s: %s", user_id, e)
+        return jsonify({"error": "Could not fetch stats"}), 500
+
 @app.route("/users/<user_id>/entries", methods=["GET"])
 def get_journal_entries(user_id):
     """Return all journal entries for a user (most-recent first)."""
@@ -752,6 +1996,35 @@ def get_journal_entries(user_id):
         logger.exception("Error fetching journal entries for %s: %s", user_id, e)
         return jsonify([]), 500 
 
+@app.route("/users/<user_id>/entries/search", methods=["GET"])
+def search_journal_entries(user_id):
+    """Full-text search over a user's journal entries (newest first), served from the inverted index."""
+    init_firestore()
+    ok, info = require_api_key_and_quota(request)
+    if not ok:
+        msg, code = info
+        return jsonify({"error": msg}), code
+
+    query = (request.args.get("q") or "").strip()
+    if not tokenize(query):
+        return jsonify({"error": "Query parameter 'q' must contain at least one word."}), 400
+    limit = request.args.get("limit", default=SEARCH_RESULT_LIMIT, type=int)
+    limit = max(1, min(limit or SEARCH_RESULT_LIMIT, SEARCH_MAX_RESULT_LIMIT))
+
+    try:
+        entry_ids = search_journal(user_id, query, limit=limit)
+        if not entry_ids:
+            return jsonify([]), 200
+        entries_ref = db.collection("users").document(user_id).collection("entries")
+        docs = {doc.id: doc for doc in db.get_all([entries_ref.document(i) for i in entry_ids]) if doc.exists}
+        entries = [{**docs[i].to_dict(), "id": i} for i in entry_ids if i in docs]
+        return jsonify(entries), 200
+    except SearchIndexUnavailable:
+        return jsonify({"error": "Search is temporarily unavailable; try again later."}), 503
+    except Exception as e:
+        logger.exception("Error searching journal entries for %s: %s", user_id, e)
+        return jsonify([]), 500
+
 @app.route("/users/<user_id>/entries/<entry_id>", methods=["PUT"])
 def update_journal_entry(user_id, entry_id):
     init_firestore()
@@ -786,12 +2059,122 @@ def update_journal_entry(user_id, entry_id):
         if not update_payload:
             return jsonify({"status": "error", "message": "No editable fields provided."}), 400 
 
+        reindex = any(field in update_payload for field in SEARCHABLE_ENTRY_FIELDS)
+        if reindex:
+            update_payload["searchPending"] = True
         doc_ref.update(update_payload)
+        if reindex:
+            old_entry = doc.to_dict() or {}
+            update_search_index(user_id, doc_ref, indexed_entry_version(old_entry))
         return jsonify({"status": "success"}), 200
     except Exception as e:
         logger.exception("Error updating journal entry %s for user %s: %s", entry_id, user_id, e)
         return jsonify({"status": "error", "message": "Could not update entry"}), 500  
 
+# -----------------------
+# Bulk export (NDJSON, streamed page by page)
+# -----------------------
+EXPORT_SUBCOLLECTIONS = ("entries", "journey")
+
+def parse_export_cursor(cursor):
+    """
+    Parse a resume cursor of the form "<section>/<doc_id>" (or just "user").
+    Returns (section, last_doc_id); raises ValueError if malformed.
+    """
+    if not cursor:
+        return None, None
+    if cursor == "user":
+        return "user", None
+    section, sep, last_id = cursor.partition("/")
+    if not sep or section not in EXPORT_SUBCOLLECTIONS or not last_id:
+        raise ValueError(f"Invalid export cursor: {cursor!r}")
+    return section, last_id
+
+def iter_user_export(user_id, page_size=None, cursor=None):
+    """
+    Yield export records for users/<user_id> and its subcollections, in a
+    stable order (user doc, then each subcollection by document id).
+
+    Each subcollection is read in pages of page_size documents; every page is
+    a fresh query consumed through stream(), so at most one page is in flight
+    and memory stays flat however many documents a user has. Every record
+    carries a "cursor"; passing it back resumes right after that record.
+    """
+    init_firestore()
+    if not db or FIRESTORE is None:
+        raise RuntimeError("Firestore is not initialized.")
+
+    page_size = page_size or EXPORT_PAGE_SIZE
+    resume_section, resume_after = parse_export_cursor(cursor)
+    user_ref = db.collection("users").document(user_id)
+
+    if resume_section is None:
+        user_doc = user_ref.get()
+        if user_doc.exists:
+            yield {"type": "user", "id": user_doc.id, "data": user_doc.to_dict(), "cursor": "user"}
+
+    sections = EXPORT_SUBCOLLECTIONS
+    if resume_section in EXPORT_SUBCOLLECTIONS:
+        sections = sections[sections.index(resume_section):]
+
+    doc_id_field = "__name__"  # FieldPath.document_id()
+    for section in sections:
+        last_id = resume_after if section == resume_section else None
+        coll_ref = user_ref.collection(section)
+        while True:
+            query = coll_ref.order_by(doc_id_field).limit(page_size)
+            if last_id:
+                query = query.start_after({doc_id_field: last_id})
+            count = 0
+            for doc in query.stream():
+                count += 1
+                last_id = doc.id
+                yield {"type": section, "id": doc.id, "data": doc.to_dict(), "cursor": f"{section}/{doc.id}"}
+            if count < page_size:
+                break
+
+def iter_user_export_ndjson(user_id, page_size=None, cursor=None):
+    """NDJSON framing of iter_user_export, ending with an "end" or "error" record."""
+    last_cursor = cursor
+    try:
+        for record in iter_user_export(user_id, page_size=page_size, cursor=cursor):
+            last_cursor = record["cursor"]
+            yield dumps_json_bytes(record) + b"\n"
+    except Exception as e:
+        # Headers are already sent; tell the client where to resume from.
+        logger.exception("Export for user %s failed after cursor %s: %s", user_id, last_cursor, e)
+        yield dumps_json_bytes({"type": "error", "message": "Export interrupted", "cursor": last_cursor}) + b"\n"
+        return
+    yield dumps_json_bytes({"type": "end", "cursor": last_cursor}) + b"\n"
+
+@app.route("/users/<user_id>/export", methods=["GET"])
+def export_user_data(user_id):
+    """Stream a user's document plus entries/journey subcollections as NDJSON."""
+    init_firestore()
+    ok, info = require_api_key_and_quota(request)
+    if not ok:
+        msg, code = info
+        return jsonify({"error": msg}), code
+
+    if not db:
+        return jsonify({"error": "Server not ready"}), 503
+
+    page_size = request.args.get("page_size", default=EXPORT_PAGE_SIZE, type=int)
+    if not page_size or page_size < 1 or page_size > EXPORT_MAX_PAGE_SIZE:
+        return jsonify({"error": f"page_size must be between 1 and {EXPORT_MAX_PAGE_SIZE}"}), 400
+
+    cursor = request.args.get("cursor") or None
+    try:
+        parse_export_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return app.response_class(
+        stream_with_context(iter_user_export_ndjson(user_id, page_size=page_size, cursor=cursor)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{user_id}.ndjson"'},
+    )
+
 @app.route("/_debug_fire")
 def debug_fire():
     try:
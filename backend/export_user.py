@@ -0,0 +1,54 @@
+# backend/export_user.py
+"""
+Offline NDJSON export of users/<id> plus its entries and journey subcollections.
+
+Same record format and cursors as GET /users/<id>/export. Run from the repo root:
+    python -m backend.export_user <user_id> [-o out.ndjson] [--page-size 500] [--cursor entries/<doc_id>]
+
+If the export is interrupted, the cursor to resume from is printed to stderr;
+re-run with --cursor <it> --append to continue the same file.
+"""
+import argparse
+import sys
+
+from backend.app import EXPORT_MAX_PAGE_SIZE, EXPORT_PAGE_SIZE, dumps_json_bytes, iter_user_export, parse_export_cursor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a user's Firestore data as NDJSON.")
+    parser.add_argument("user_id")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--append", action="store_true", help="Append to --output instead of truncating it")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--cursor", help="Resume after this cursor (from a previous record)")
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.page_size <= EXPORT_MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {EXPORT_MAX_PAGE_SIZE}")
+    try:
+        parse_export_cursor(args.cursor)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.output, "ab" if args.append else "wb") if args.output else sys.stdout.buffer
+    last_cursor = args.cursor
+    count = 0
+    try:
+        for record in iter_user_export(args.user_id, page_size=args.page_size, cursor=args.cursor):
+            out.write(dumps_json_bytes(record) + b"\n")
+            last_cursor = record["cursor"]
+            count += 1
+    except Exception as e:
+        print(f"Export interrupted after {count} records: {e}", file=sys.stderr)
+        print(f"Resume with: --cursor {last_cursor} --append" if last_cursor else "Nothing exported; re-run from the start.",
+              file=sys.stderr)
+        return 1
+    finally:
+        if out is sys.stdout.buffer:
+            out.flush()
+        else:
+            out.close()
+    print(f"Exported {count} records.", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# backend/import_resources.py
+"""
+Bulk upsert/delete of the articles catalog from a JSON array or NDJSON file.
+
+Same item format and validation as POST /resources/bulk. Run from the repo root:
+    python -m backend.import_resources catalog.ndjson [--mode replace] [--dry-run]
+
+Reads stdin when the path is '-'. Exits non-zero if any item is invalid or fails.
+"""
+import argparse
+import sys
+
+from backend.app import (
+    bulk_write_resources,
+    dumps_json_bytes,
+    init_firestore,
+    parse_bulk_payload,
+    validate_resource_items,
+)
+import backend.app as backend_app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk upsert/delete articles in Firestore.")
+    parser.add_argument("path", help="JSON array or NDJSON file ('-' for stdin)")
+    parser.add_argument("--mode", choices=("merge", "replace"), default="merge",
+                        help="merge fields into existing articles (default) or replace them")
+    parser.add_argument("--format", choices=("auto", "json", "ndjson"), default="auto")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only; write nothing")
+    args = parser.parse_args(argv)
+
+    if args.path == "-":
+        raw = sys.stdin.buffer.read()
+    else:
+        with open(args.path, "rb") as f:
+            raw = f.read()
+    content_type = "application/x-ndjson" if args.format == "ndjson" else ""
+    if args.format == "json" and not raw.lstrip().startswith(b"["):
+        parser.error("--format json expects a JSON array")
+
+    try:
+        items = parse_bulk_payload(raw, content_type)
+    except ValueError as e:
+        print(f"Could not parse {args.path}: {e}", file=sys.stderr)
+        return 2
+
+    ops, errors = validate_resource_items(items)
+    for error in errors:
+        print(dumps_json_bytes(error).decode("utf-8"), file=sys.stderr)
+    if errors:
+        print(f"{len(errors)} invalid item(s); nothing written.", file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print(f"{len(ops)} item(s) valid.", file=sys.stderr)
+        return 0
+
+    init_firestore()
+    if not backend_app.db:
+        print("Firestore is not available.", file=sys.stderr)
+        return 2
+
+    results = bulk_write_resources(ops, replace=(args.mode == "replace"))
+    failed = [r for r in results if r["status"] != "ok"]
+    for result in failed:
+        print(dumps_json_bytes(result).decode("utf-8"), file=sys.stderr)
+    print(f"Wrote {len(results) - len(failed)} item(s), {len(failed)} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# benchmarks/bench_logging.py
+"""
+Request latency with logging off, synchronous, and async (QueueListener).
+
+Drives GET /resources/<id> through the Flask test client so every request runs
+the real require_api_key_and_quota hot path and the per-request access line.
+Firestore is replaced by a small in-memory stand-in so only the logging cost
+varies between runs. Log output goes to a temp file, and then to a sink whose
+writes block for --sink-latency-us (a stand-in for a stdout pipe under
+backpressure), which is where the queue pays off.
+
+Run from the repo root:
+    python -m benchmarks.bench_logging [--requests 5000] [--sink-latency-us 200]
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+import types
+
+import backend.app as backend_app
+
+class _SlowSink:
+    """Text stream whose writes block (releasing the GIL) like a congested pipe."""
+
+    def __init__(self, latency_us):
+        self.latency = latency_us / 1e6
+
+    def write(self, text):
+        time.sleep(self.latency)
+        return len(text)
+
+    def flush(self):
+        pass
+
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class _DocRef:
+    def __init__(self, store, collection, doc_id):
+        self._store, self._collection, self.id = store, collection, doc_id
+
+    def get(self, transaction=None):
+        return _Snapshot(self.id, self._store.get((self._collection, self.id)))
+
+class _Collection:
+    def __init__(self, store, name):
+        self._store, self._name = store, name
+
+    def document(self, doc_id):
+        return _DocRef(self._store, self._name, doc_id)
+
+class _MemoryFirestore:
+    """Just enough of the client for the API-key check and a single-document read."""
+
+    def __init__(self):
+        self.store = {
+            ("api_keys", "bench-key"): {"quota_daily": 10 ** 12, "used_today": 0, "last_used": ""},
+            ("articles", "a1"): {"title": "Breathing basics", "content": "Inhale, exhale."},
+        }
+
+    def collection(self, name):
+        return _Collection(self.store, name)
+
+    def transaction(self):
+        return types.SimpleNamespace(update=lambda ref, data: None)
+
+def _install_stand_in():
+    backend_app.db = _MemoryFirestore()
+    backend_app.FIRESTORE = types.SimpleNamespace(
+        transactional=lambda fn: fn,
+        SERVER_TIMESTAMP=object(),
+    )
+    backend_app.init_vertex_basic = lambda: None
+    # Every request comes from one test-client IP; keep the burst limiters out of the timings.
+    backend_app._ip_limiter.rate = backend_app._key_limiter.rate = 0
+
+def _run(client, n):
+    headers = {"x-api-key": "bench-key"}
+    latencies = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        client.get("/resources/a1", headers=headers)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+CONFIGS = [
+    ("off", dict(level="WARNING", use_async=False, sample_rates={})),
+    ("sync", dict(level="INFO", use_async=False, sample_rates={})),
+    ("sync, sampled", dict(level="INFO", use_async=False, sample_rates=None)),
+    ("async", dict(level="INFO", use_async=True, sample_rates={})),
+    ("async, sampled", dict(level="INFO", use_async=True, sample_rates=None)),
+]
+
+def _bench_sink(client, sink_name, sink, n):
+    print(f"\nsink: {sink_name}")
+    print(f"{'logging':<16} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+    for name, config in CONFIGS:
+        backend_app.setup_logging(stream=sink, force=True, **config)
+        _run(client, min(500, n))  # warm up
+        mean, p50, p99 = _run(client, n)
+        print(f"{name:<16} {mean:>9.1f} {p50:>9.1f} {p99:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Request latency with logging on and off.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--sink-latency-us", type=int, default=200)
+    args = parser.parse_args()
+
+    _install_stand_in()
+    client = backend_app.app.test_client()
+    with tempfile.TemporaryFile("w") as sink:
+        _bench_sink(client, "temp file", sink, args.requests)
+    _bench_sink(client, f"blocking writes ({args.sink_latency_us}us)", _SlowSink(args.sink_latency_us), args.requests)
+    backend_app.setup_logging(force=True)
+    logging.shutdown()
+
+if __name__ == "__main__":
+    main()
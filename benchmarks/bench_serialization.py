@@ -0,0 +1,92 @@
+# benchmarks/bench_serialization.py
+"""
+Compare JSON encoders and content-codings for the list endpoints.
+
+Builds synthetic payloads shaped like GET /resources (1k articles) and
+GET /users/<id>/entries (5k entries, Firestore timestamps) and reports encode
+time plus bytes on the wire for identity / gzip / br.
+
+Run from the repo root:
+    python -m benchmarks.bench_serialization [--repeat 20]
+"""
+import argparse
+import random
+import string
+import time
+from datetime import timezone, timedelta
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from backend.app import dumps_json_bytes, compress_body, orjson, brotli
+
+BASE_TS = DatetimeWithNanoseconds(2024, 1, 1, tzinfo=timezone.utc)
+
+# A fixed vocabulary keeps the text about as compressible as real prose.
+_VOCAB_RNG = random.Random(0)
+VOCAB = ["".join(_VOCAB_RNG.choices(string.ascii_lowercase, k=_VOCAB_RNG.randint(2, 9))) for _ in range(2000)]
+
+def _words(rng, n):
+    return " ".join(rng.choices(VOCAB, k=n))
+
+def make_articles(n, seed=1):
+    rng = random.Random(seed)
+    return [{
+        "id": f"article{i:05d}",
+        "title": _words(rng, 6).title(),
+        "summary": _words(rng, 30),
+        "content": _words(rng, 120),
+        "category": rng.choice(["stress", "sleep", "anxiety", "focus"]),
+        "readMinutes": rng.randint(2, 15),
+    } for i in range(n)]
+
+def make_entries(n, seed=2):
+    rng = random.Random(seed)
+    return [{
+        "id": f"entry{i:06d}",
+        "title": _words(rng, 4),
+        "body": _words(rng, 60),
+        "date": (BASE_TS + timedelta(hours=i)).date().isoformat(),
+        "dateAdded": BASE_TS + timedelta(hours=i, microseconds=rng.randint(0, 999999)),
+    } for i in range(n)]
+
+def _time_encode(payload, encoder, repeat):
+    best = float("inf")
+    body = b""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = dumps_json_bytes(payload, encoder=encoder)
+        best = min(best, time.perf_counter() - t0)
+    return best, body
+
+def _time_compress(body, encoding, repeat):
+    best = float("inf")
+    out = b""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = compress_body(body, encoding)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(out)
+
+def run(repeat):
+    payloads = {
+        "1k articles": make_articles(1000),
+        "5k entries": make_entries(5000),
+    }
+    encoders = ["stdlib"] + (["orjson"] if orjson is not None else [])
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+
+    print(f"{'payload':<12} {'encoder':<8} {'encode ms':>10} {'identity B':>11}"
+          + "".join(f" {e + ' B':>10} {e + ' ms':>9}" for e in encodings))
+    for name, payload in payloads.items():
+        for encoder in encoders:
+            secs, body = _time_encode(payload, encoder, repeat)
+            row = f"{name:<12} {encoder:<8} {secs * 1000:>10.2f} {len(body):>11}"
+            for encoding in encodings:
+                csecs, size = _time_compress(body, encoding, max(1, repeat // 4))
+                row += f" {size:>10} {csecs * 1000:>9.2f}"
+            print(row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    run(parser.parse_args().repeat)
@@ -72,6 +72,27 @@ resource "google_firestore_database" "database" {
   depends_on  = [google_project_service.firestore_api]
 }
 
+# Journal search shards (users/<id>/search_index/*) are only read by id. Their
+# postings maps and id blobs are never queried, so skip automatic indexing of
+# those fields; otherwise every term key would count toward the 40k limit.
+resource "google_firestore_field" "search_index_postings" {
+  project    = "sahara-wellness-prototype"
+  database   = google_firestore_database.database.name
+  collection = "search_index"
+  field      = "postings"
+
+  index_config {}
+}
+
+resource "google_firestore_field" "search_index_ids" {
+  project    = "sahara-wellness-prototype"
+  database   = google_firestore_database.database.name
+  collection = "search_index"
+  field      = "ids"
+
+  index_config {}
+}
+
 # ---------------------------------------------------------------- #
 #                    --- CLOUD RUN BACKEND SERVICE ---            #
 # ---------------------------------------------------------------- #
@@ -95,6 +116,13 @@ resource "google_cloud_run_v2_service" "sahara_backend" {
     containers {
       image = "asia-south1-docker.pkg.dev/sahara-wellness-prototype/sahara-repo/sahara-backend:latest"
 
+      # Requests arrive via API Gateway -> Cloud Run, so the client address is
+      # the second X-Forwarded-For entry from the right (the last is the gateway).
+      env {
+        name  = "RATE_LIMIT_PROXY_HOPS"
+        value = "2"
+      }
+
 
 
 
@@ -0,0 +1,60 @@
+import pytest
+
+import backend.app as backend_app
+from backend.app import parse_bulk_payload, validate_resource_item, validate_resource_items
+
+def test_parse_json_array():
+    assert parse_bulk_payload(b' [{"id": "a"}, {"id": "b"}] ') == [{"id": "a"}, {"id": "b"}]
+    assert parse_bulk_payload('[{"title": "é"}]') == [{"title": "é"}]
+
+def test_parse_ndjson_skips_blank_lines():
+    body = b'{"id": "a"}\n\n{"id": "b", "_delete": true}\n'
+    assert parse_bulk_payload(body) == [{"id": "a"}, {"id": "b", "_delete": True}]
+
+def test_ndjson_content_type_wins_over_leading_bracket():
+    # A single NDJSON line that happens to be an array is one item, not the payload.
+    assert parse_bulk_payload(b'[1, 2]', "application/x-ndjson") == [[1, 2]]
+
+@pytest.mark.parametrize("body, message", [
+    (b"   ", "Empty body"),
+    (b"[{", "Invalid JSON array"),
+    (b'{"id": "a"}\n{oops', "line 2"),
+])
+def test_parse_errors(body, message):
+    with pytest.raises(ValueError, match=message):
+        parse_bulk_payload(body)
+
+def test_upsert_and_delete_items():
+    assert validate_resource_item({"id": "a", "title": "T"}) == ("upsert", "a", {"title": "T"})
+    assert validate_resource_item({"title": "T"}) == ("upsert", None, {"title": "T"})
+    assert validate_resource_item({"id": "a", "_delete": True}) == ("delete", "a", None)
+
+@pytest.mark.parametrize("item, message", [
+    ([], "JSON object"),
+    ({"_delete": True}, "requires an id"),
+    ({"id": "a", "_delete": "yes"}, "must be a boolean"),
+    ({"id": "a"}, "at least one field"),
+    ({"id": "a/b", "title": "T"}, "Invalid id"),
+    ({"id": "..", "title": "T"}, "Invalid id"),
+    ({"id": "__x__", "title": "T"}, "Invalid id"),
+    ({"id": 7, "title": "T"}, "Invalid id"),
+    ({"id": "a", "__name__": "T"}, "Invalid field name"),
+    ({"id": "a", "": "T"}, "Invalid field name"),
+])
+def test_invalid_items(item, message):
+    with pytest.raises(ValueError, match=message):
+        validate_resource_item(item)
+
+def test_validate_items_reports_per_item_errors_and_duplicates():
+    items = [{"id": "a", "title": "T"}, {"id": "a", "title": "U"}, "nope", {"title": "V"}, {"title": "W"}]
+    ops, errors = validate_resource_items(items)
+    assert ops == [(0, "upsert", "a", {"title": "T"}), (3, "upsert", None, {"title": "V"}),
+                   (4, "upsert", None, {"title": "W"})]
+    assert [(e["index"], e["id"]) for e in errors] == [(1, "a"), (2, None)]
+    assert "Duplicate id" in errors[0]["error"]
+
+def test_validate_items_rejects_oversized_payload(monkeypatch):
+    monkeypatch.setattr(backend_app, "BULK_MAX_ITEMS", 2)
+    ops, errors = validate_resource_items([{"title": "T"}] * 3)
+    assert ops == []
+    assert len(errors) == 1 and "Too many items" in errors[0]["error"]
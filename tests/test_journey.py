@@ -0,0 +1,96 @@
+from datetime import date, datetime, timezone
+
+from backend.app import FIRESTORE, _transactional_journey_create, _transactional_journey_update, _week_key
+
+class _Snap:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+class _Ref:
+    def __init__(self, data=None):
+        self.data = data
+
+    def get(self, transaction=None):
+        return _Snap(self.data)
+
+class _Transaction:
+    """Records writes; only the item ref is actually mutated."""
+
+    def __init__(self):
+        self.rollups = []
+
+    def create(self, ref, data):
+        assert ref.data is None
+        ref.data = dict(data)
+
+    def update(self, ref, data):
+        ref.data = {**ref.data, **data}
+
+    def set(self, ref, data, merge=False):
+        assert merge
+        self.rollups.append(data)
+
+def _completed_delta(rollup, day):
+    """journey_completed delta a rollup payload applies to day's bucket (and checks it matches totals/week)."""
+    total = rollup["totals"]["journey_completed"].value
+    assert rollup["daily"][day.isoformat()]["journey_completed"].value == total
+    assert rollup["weekly"][_week_key(day)]["journey_completed"].value == total
+    return total
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+def test_create_completed_item_counts_it_once():
+    item_ref, txn = _Ref(), _Transaction()
+    item = {"title": "Walk", "isCompleted": True, "completedAt": _today().isoformat()}
+    assert _transactional_journey_create(txn, item_ref, _Ref(), item) is True
+    assert item_ref.data["title"] == "Walk"
+    assert [_completed_delta(r, _today()) for r in txn.rollups] == [1]
+
+    # A retry with the same client id finds the item and counts nothing.
+    retry = _Transaction()
+    assert _transactional_journey_create(retry, item_ref, _Ref(), item) is False
+    assert retry.rollups == []
+
+def test_create_open_item_has_no_rollup():
+    txn = _Transaction()
+    assert _transactional_journey_create(txn, _Ref(), _Ref(), {"title": "Walk", "isCompleted": False}) is True
+    assert txn.rollups == []
+
+def test_completing_stamps_completed_at_and_counts_today():
+    item_ref, txn = _Ref({"title": "Walk", "isCompleted": False}), _Transaction()
+    assert _transactional_journey_update(txn, item_ref, _Ref(), {"isCompleted": True}) is True
+    assert item_ref.data["completedAt"] == _today().isoformat()
+    assert [_completed_delta(r, _today()) for r in txn.rollups] == [1]
+
+def test_uncompleting_takes_it_off_the_day_it_was_completed():
+    completed_on = date(2024, 3, 4)
+    item_ref = _Ref({"title": "Walk", "isCompleted": True, "completedAt": completed_on.isoformat()})
+    txn = _Transaction()
+    assert _transactional_journey_update(txn, item_ref, _Ref(), {"isCompleted": False}) is True
+    assert item_ref.data["completedAt"] is FIRESTORE.DELETE_FIELD
+    assert [_completed_delta(r, completed_on) for r in txn.rollups] == [-1]
+    assert list(txn.rollups[0]["daily"]) == ["2024-03-04"]
+
+def test_uncompleting_legacy_item_without_completed_at_does_not_decrement():
+    item_ref, txn = _Ref({"title": "Walk", "isCompleted": True}), _Transaction()
+    assert _transactional_journey_update(txn, item_ref, _Ref(), {"isCompleted": False}) is True
+    assert item_ref.data["isCompleted"] is False
+    assert txn.rollups == []
+
+def test_unchanged_completion_and_client_completed_at_are_ignored():
+    item_ref = _Ref({"title": "Walk", "isCompleted": True, "completedAt": "2024-03-04"})
+    txn = _Transaction()
+    update = {"isCompleted": "true", "completedAt": "1999-01-01", "title": "Run"}
+    assert _transactional_journey_update(txn, item_ref, _Ref(), update) is True
+    assert item_ref.data == {"title": "Run", "isCompleted": "true", "completedAt": "2024-03-04"}
+    assert txn.rollups == []
+
+def test_missing_item_is_reported():
+    txn = _Transaction()
+    assert _transactional_journey_update(txn, _Ref(), _Ref(), {"isCompleted": True}) is False
+    assert txn.rollups == []
@@ -0,0 +1,19 @@
+import logging
+
+from backend.app import RequestContextFilter
+
+def _record(msg):
+    return logging.LogRecord("test", logging.WARNING, __file__, 1, msg, None, None)
+
+def test_sampled_out_message_is_dropped():
+    log_filter = RequestContextFilter({"noisy %s": 0.0, "kept %s": 1.0})
+    assert log_filter.filter(_record("noisy %s")) is False
+    assert log_filter.filter(_record("kept %s")) is True
+    assert log_filter.filter(_record("other %s")) is True
+
+def test_non_string_messages_pass_through():
+    log_filter = RequestContextFilter({"noisy %s": 0.0})
+    record = _record({"a": 1})
+    assert log_filter.filter(record) is True
+    assert hasattr(record, "request_id")
+    assert log_filter.filter(_record(["a"])) is True
@@ -0,0 +1,66 @@
+import pytest
+from flask import request
+
+import backend.app as backend_app
+from backend.app import TokenBucketLimiter, _client_ip, app
+
+def test_burst_then_rejects_with_retry_after():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.acquire("k", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("k", now=0.0) == pytest.approx(0.5)
+
+def test_refills_at_rate_up_to_burst():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    for _ in range(3):
+        limiter.acquire("k", now=0.0)
+    assert limiter.acquire("k", now=0.5) == 0.0
+    assert limiter.acquire("k", now=0.5) == pytest.approx(0.5)
+    # A long idle period refills only up to burst.
+    assert [limiter.acquire("k", now=100.0) for _ in range(4)][-1] == pytest.approx(0.5)
+
+def test_rejected_requests_do_not_consume_tokens():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.acquire("k", now=0.0) == 0.0
+    assert limiter.acquire("k", now=0.25) == pytest.approx(0.75)
+    assert limiter.acquire("k", now=0.5) == pytest.approx(0.5)
+    assert limiter.acquire("k", now=1.0) == 0.0
+
+def test_keys_are_independent():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.acquire("a", now=0.0) == 0.0
+    assert limiter.acquire("a", now=0.0) > 0
+    assert limiter.acquire("b", now=0.0) == 0.0
+
+def test_least_recently_used_key_is_evicted():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    limiter.acquire("a", now=0.0)
+    limiter.acquire("b", now=0.0)
+    limiter.acquire("a", now=0.0)  # "b" is now least recently used
+    limiter.acquire("c", now=0.0)
+    assert limiter.acquire("b", now=0.0) == 0.0  # evicted, so it starts with a full bucket
+    assert limiter.acquire("c", now=0.0) > 0
+
+def test_zero_rate_disables_limiting():
+    limiter = TokenBucketLimiter(rate=0, burst=1)
+    assert all(limiter.acquire("k", now=0.0) == 0.0 for _ in range(10))
+
+def _ip_for(forwarded, remote_addr="10.0.0.1"):
+    headers = {"X-Forwarded-For": forwarded} if forwarded is not None else {}
+    with app.test_request_context("/", headers=headers, environ_base={"REMOTE_ADDR": remote_addr}):
+        return _client_ip(request)
+
+def test_client_ip_behind_api_gateway():
+    # "<client-supplied>, client (appended by the gateway), gateway (appended by Cloud Run)"
+    assert _ip_for("spoof, 203.0.113.7, 34.1.2.3") == "203.0.113.7"
+    assert _ip_for("203.0.113.7, 34.1.2.3") == "203.0.113.7"
+
+def test_client_ip_ignores_rotating_client_supplied_entries():
+    assert {_ip_for(f"{spoof}, 203.0.113.7, 34.1.2.3") for spoof in ("1.1.1.1", "2.2.2.2", "a, b")} == {"203.0.113.7"}
+
+def test_client_ip_short_header_and_fallback():
+    assert _ip_for("34.1.2.3") == "34.1.2.3"
+    assert _ip_for(None) == "10.0.0.1"
+
+def test_client_ip_hops_zero_trusts_leftmost(monkeypatch):
+    monkeypatch.setattr(backend_app, "RATE_LIMIT_PROXY_HOPS", 0)
+    assert _ip_for("spoof, 203.0.113.7, 34.1.2.3") == "spoof"
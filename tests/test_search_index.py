@@ -0,0 +1,164 @@
+import time
+
+from backend.app import (
+    SEARCH_BLOCK_SIZE,
+    JournalSearchIndex,
+    _transactional_claim_search_build,
+    _transactional_publish_search_build,
+    _decode_postings,
+    _encode_postings,
+    apply_entry_terms,
+    entry_terms,
+    indexed_entry_version,
+    search_block,
+    term_bucket,
+)
+
+def _index(entries):
+    """Build an in-memory index from a list of entry dicts (ordinal = list position)."""
+    index = JournalSearchIndex(generation=1, next_ordinal=len(entries))
+    for ordinal, entry in enumerate(entries):
+        block = search_block(ordinal)
+        shards = {bucket: postings for (b, bucket), postings in index.shards.items() if b == block}
+        apply_entry_terms(shards, block, ordinal, set(), entry_terms(entry))
+        for bucket, postings in shards.items():
+            index.shards[(block, bucket)] = postings
+    return index
+
+def test_postings_codec_round_trip():
+    ordinals = [0, 1, 2, 127, 128, 300, 16383, 16384, 2 ** 21, 2 ** 31]
+    assert list(_decode_postings(_encode_postings(ordinals))) == ordinals
+    assert list(_decode_postings(_encode_postings([]))) == []
+
+def test_postings_codec_round_trip_with_block_base():
+    base = 3 * SEARCH_BLOCK_SIZE
+    ordinals = [base, base + 5, base + SEARCH_BLOCK_SIZE - 1]
+    data = _encode_postings(ordinals, base)
+    assert data[0] == 0  # first delta is relative to the base, not to zero
+    assert list(_decode_postings(data, base)) == ordinals
+
+def test_term_bucket():
+    assert term_bucket("calm") == "c"
+    assert term_bucket("2024") == "2"
+    assert term_bucket("état") == "_"
+    assert term_bucket("uplift") == "u"
+
+def test_editing_entry_moves_its_terms():
+    shards = {}
+    apply_entry_terms(shards, 0, 7, set(), entry_terms({"title": "Calm morning", "body": "slow breathing"}))
+
+    old_terms = entry_terms({"title": "Calm morning", "body": "slow breathing"})
+    new_terms = entry_terms({"title": "Calm morning", "body": "long walk"})
+    changed = apply_entry_terms(shards, 0, 7, old_terms, new_terms)
+
+    assert changed == {"s", "b", "l", "w"}
+    assert "slow" not in shards["s"] and "breathing" not in shards["b"]
+    assert list(shards["l"]["long"]) == [7]
+    assert list(shards["c"]["calm"]) == [7]
+
+def test_edit_after_failed_update_scrubs_stale_terms():
+    shards = {}
+    v1 = {"body": "rainy commute", "searchOrdinal": 4}
+    apply_entry_terms(shards, 0, 4, set(), entry_terms(v1))
+    # The v2 update was written but its index update failed, so the entry is
+    # stored as v2 while the index still holds v1's terms.
+    stored = {"body": "sunny park", "searchOrdinal": 4, "searchPending": True}
+    v3 = {**stored, "body": "sunny beach"}
+
+    old_entry = indexed_entry_version(stored)
+    assert old_entry is None
+    apply_entry_terms(shards, 0, 4, None if old_entry is None else entry_terms(old_entry), entry_terms(v3))
+
+    indexed = {term for postings in shards.values() for term, ords in postings.items() if 4 in ords}
+    assert indexed == {"sunny", "beach"}
+
+def test_indexed_entry_version_keeps_settled_entries():
+    stored = {"body": "calm", "searchOrdinal": 1}
+    assert indexed_entry_version(stored) is stored
+
+def test_scrub_removes_ordinal_when_old_terms_unknown():
+    shards = {}
+    apply_entry_terms(shards, 0, 1, set(), {"calm", "rain"})
+    apply_entry_terms(shards, 0, 2, set(), {"calm"})
+
+    changed = apply_entry_terms(shards, 0, 1, None, {"sun"})
+
+    assert changed == {"c", "r", "s"}
+    assert list(shards["c"]["calm"]) == [2]
+    assert "rain" not in shards["r"]
+    assert list(shards["s"]["sun"]) == [1]
+
+def test_postings_stay_sorted_for_out_of_order_inserts():
+    shards = {}
+    for ordinal in (5, 2, 9, 2):
+        apply_entry_terms(shards, 0, ordinal, set(), {"calm"})
+    assert list(shards["c"]["calm"]) == [2, 5, 9]
+
+def test_search_requires_all_terms_and_returns_newest_first():
+    index = _index([
+        {"title": "calm morning"},
+        {"title": "anxious morning"},
+        {"body": "calm evening, calm morning"},
+    ])
+    assert index.search("calm morning") == [2, 0]
+    assert index.search("anxious calm") == []
+
+def test_search_matches_last_term_as_prefix():
+    index = _index([
+        {"body": "breathing exercise"},
+        {"body": "breakfast"},
+        {"body": "deep breath"},
+    ])
+    assert index.search("brea") == [2, 1, 0]
+    assert index.search("breath") == [2, 0]
+    # Only the last token is a prefix; earlier ones must match exactly.
+    assert index.search("deep brea") == [2]
+    assert index.search("dee breath") == []
+
+def test_search_spans_blocks_and_respects_limit():
+    entries = [{"body": "calm"}] * (SEARCH_BLOCK_SIZE + 3)
+    index = _index(entries)
+    last = len(entries) - 1
+    assert index.search("calm", limit=5) == list(range(last, last - 5, -1))
+
+def test_entry_ids_maps_ordinals_through_id_blocks():
+    index = JournalSearchIndex(generation=1, next_ordinal=SEARCH_BLOCK_SIZE + 2)
+    index.id_blocks = {0: ["a", "", "c"], 1: ["x", "y"]}
+    assert index.entry_ids([SEARCH_BLOCK_SIZE + 1, 2, 1, 0]) == ["y", "c", "a"]
+
+class _Snap:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+class _MetaRef:
+    def __init__(self, data=None):
+        self.data = data
+
+    def get(self, transaction=None):
+        return _Snap(self.data)
+
+class _Transaction:
+    def set(self, ref, data):
+        ref.data = dict(data)
+
+def test_build_lease_is_exclusive_until_it_expires():
+    meta = _MetaRef()
+    assert _transactional_claim_search_build(_Transaction(), meta, 100) is True
+    assert meta.data["building"] == 100
+    assert _transactional_claim_search_build(_Transaction(), meta, 200) is False
+
+    meta.data["build_lease_until"] = time.time() - 1
+    assert _transactional_claim_search_build(_Transaction(), meta, 200) is True
+    assert meta.data["building"] == 200
+
+def test_only_the_lease_holder_publishes():
+    meta = _MetaRef({"built": False, "building": 200, "build_lease_until": time.time() + 60})
+    assert _transactional_publish_search_build(_Transaction(), meta, 100, 5) is False
+    assert _transactional_publish_search_build(_Transaction(), meta, 200, 7) is True
+    assert meta.data["built"] and meta.data["generation"] == 200 and meta.data["next_ordinal"] == 7
+    # Once built, a claim returns the published meta instead of starting another build.
+    assert _transactional_claim_search_build(_Transaction(), meta, 300)["generation"] == 200